@@ -0,0 +1,62 @@
+"""
+On-disk caches for the ArXiv search tool.
+
+Gemini summaries and arXiv feed validators are kept in shelve databases under
+CACHE_DIR (default ~/.cache/dailyarxiv) so repeated runs can skip work.
+"""
+
+import hashlib
+import os
+import shelve
+import threading
+from typing import Dict, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "dailyarxiv")
+
+# Subject queries run on worker threads; shelve does not allow concurrent access
+_FEED_CACHE_LOCK = threading.Lock()
+
+def hash_text(text: str) -> str:
+    """Hash text into a short, stable cache key."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def open_cache(name: str):
+    """Open a shelve cache under CACHE_DIR, or an empty dict if it is unavailable."""
+    cache_dir = os.getenv("CACHE_DIR", DEFAULT_CACHE_DIR)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        return shelve.open(os.path.join(cache_dir, name))
+    except Exception as e:
+        print(f"⚠️ Cache '{name}' unavailable: {e}")
+        return {}
+
+def close_cache(cache) -> None:
+    """Close a cache returned by open_cache."""
+    if isinstance(cache, shelve.Shelf):
+        try:
+            cache.close()
+        except Exception as e:
+            print(f"⚠️ Could not close cache: {e}")
+
+def load_cached_feed(url: str) -> Optional[Dict]:
+    """Return the cached validators and entries for a feed URL, if any."""
+    with _FEED_CACHE_LOCK:
+        cache = open_cache("feeds")
+        try:
+            return cache.get(url)
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable feed cache entry: {e}")
+            return None
+        finally:
+            close_cache(cache)
+
+def store_cached_feed(url: str, record: Dict) -> None:
+    """Save validators and parsed entries for a feed URL; failures only warn."""
+    with _FEED_CACHE_LOCK:
+        cache = open_cache("feeds")
+        try:
+            cache[url] = record
+        except Exception as e:
+            print(f"⚠️ Could not update feed cache: {e}")
+        finally:
+            close_cache(cache)
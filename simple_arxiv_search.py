@@ -7,14 +7,25 @@ and sends results to Slack. Optimized for minimal token usage with Gemini 1.5 Fl
 """
 
 import requests
-import xml.etree.ElementTree as ET
 import re
 import os
 import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import List, Dict
+from textwrap import shorten
+from typing import List, Dict, Optional, NamedTuple
+from urllib.parse import urlencode
 from dotenv import load_dotenv
 
+from cache import hash_text, open_cache, close_cache, load_cached_feed, store_cached_feed
+
+# Prefer lxml's C parser for the Atom feed; fall back to the stdlib parser
+try:
+    from lxml import etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
 # Load environment variables
 load_dotenv()
 
@@ -23,132 +34,407 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN", "")
 SLACK_CHANNEL_ID = os.getenv("SLACK_CHANNEL_ID", "")
 
-# Gemini configuration
-import google.generativeai as genai
-genai.configure(api_key=GEMINI_API_KEY)
+# arXiv configuration
+ARXIV_API_URL = "http://export.arxiv.org/api/query"
+DEFAULT_SUBJECT = "astro-ph.GA"
+MAX_FETCH_WORKERS = 8
+
+# Shared HTTP session so concurrent subject queries reuse pooled connections;
+# transient failures are retried with backoff by urllib3 on the same pool
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+_RETRY = Retry(
+    total=3,
+    backoff_factor=1,
+    status_forcelist=[429, 500, 502, 503, 504],
+    respect_retry_after_header=True
+)
+_ADAPTER = HTTPAdapter(max_retries=_RETRY, pool_connections=MAX_FETCH_WORKERS, pool_maxsize=MAX_FETCH_WORKERS)
+_SESSION = requests.Session()
+_SESSION.headers.update({"User-Agent": "DailyArXiv (https://github.com/Niusha951/DailyArXiv)"})
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+
+# arXiv Atom feed tags, pre-qualified for direct comparison with element tags
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+ATOM_ENTRY = ATOM_NS + "entry"
+ATOM_TITLE = ATOM_NS + "title"
+ATOM_SUMMARY = ATOM_NS + "summary"
+ATOM_ID = ATOM_NS + "id"
+
+# Gemini configuration (the SDK is imported on first use; it is slow to load)
+GEMINI_MODEL = "models/gemini-1.5-flash"
+_MODEL = None
+# Max concurrent Gemini requests; keep low enough to stay under rate limits
+GEMINI_PARALLELISM = max(1, int(os.getenv("GEMINI_PARALLELISM", "4")))
+# Abstracts are cut at a word boundary to fit this many characters
+MAX_ABSTRACT_LENGTH = 150
+# Approximate prompt token budget for papers sent together in one request
+MAX_TOKENS_PER_BATCH = int(os.getenv("MAX_TOKENS_PER_BATCH", "1000"))
+
+ERROR_SUMMARY = "Error processing paper."
+
+# Prompt templates, filled in per paper/batch with str.format
+_PROMPT_TMPL = """Summarize this arXiv paper in 2-3 bullet points:
+Title: {title}
+Abstract: {abstract}
+
+Focus on key findings. Be concise."""
+
+_BATCH_PROMPT_TMPL = """Summarize each arXiv paper below in 2-3 bullet points.
+Start each answer with its ===PAPER k=== line, in the same order.
 
-# Slack configuration
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
+{papers}
+
+Focus on key findings. Be concise."""
+
+_BATCH_SECTION_TMPL = "===PAPER {index}===\nTitle: {title}\nAbstract: {abstract}"
+
+# Marker lines that delimit papers in batched prompts and responses
+_BATCH_MARKER_RE = re.compile(r'^\W*=+\s*PAPER\s+(\d+)\s*=+\W*$', re.MULTILINE)
+
+# Markdown-to-Slack patterns, compiled once. Headers, links and bullets are
+# matched by one alternation so the message is rewritten in a single pass.
+_LINK_RE = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+_SLACK_MARKUP_RE = re.compile(
+    r'^# (?P<h1>.+)$'
+    r'|^## (?P<h2>.+)$'
+    r'|\[(?P<text>[^\]]+)\]\((?P<url>[^)]+)\)'
+    r'|(?P<bullet>^\s*[-*]\s+)',
+    re.MULTILINE
+)
+_MULTI_NEWLINE_RE = re.compile(r'\n{3,}')
+
+class Paper(NamedTuple):
+    """An arXiv paper as returned by the search."""
+    title: str
+    summary: str
+    link: str
 
 def clean_text(text: str) -> str:
     """Remove newlines and excessive spaces."""
     if not text:
         return ""
-    return re.sub(r'\s+', ' ', text).strip()
+    # str.split() collapses and strips all whitespace in C, no regex needed
+    return ' '.join(text.split())
+
+def parse_arxiv_entries(source) -> List[Paper]:
+    """
+    Incrementally parse an arXiv Atom feed into Paper tuples.
+    
+    Each <entry> is dropped from the tree once it has been read, so memory
+    stays flat regardless of max_results.
+    
+    Args:
+        source: File-like object yielding the raw Atom XML
+        
+    Returns:
+        List of Paper tuples with title, summary, and link
+    """
+    entries = []
+    root = None
+    
+    for event, entry in ET.iterparse(source, events=("start", "end")):
+        if root is None:
+            root = entry
+            continue
+        if event != "end" or entry.tag != ATOM_ENTRY:
+            continue
+        
+        # One pass over the children instead of a find() scan per field
+        raw_title = raw_summary = link = None
+        for child in entry:
+            tag = child.tag
+            if tag == ATOM_TITLE and raw_title is None:
+                raw_title = child.text or ""
+            elif tag == ATOM_SUMMARY and raw_summary is None:
+                raw_summary = child.text or ""
+            elif tag == ATOM_ID and link is None:
+                link = child.text or ""
+            if raw_title is not None and raw_summary is not None and link is not None:
+                break
+        
+        if raw_title is not None and raw_summary is not None and link is not None:
+            # Clean up whitespace
+            title = clean_text(raw_title)
+            summary = clean_text(raw_summary)
+            
+            entries.append(Paper(title, summary, link.strip()))
+        
+        # Free the parsed entry before the next one is read
+        entry.clear()
+        root.remove(entry)
+    
+    return entries
 
-def search_arxiv_papers(keywords: str, subject: str = "astro-ph.GA", max_results: int = 3) -> List[Dict[str, str]]:
+def search_arxiv_papers(keywords: str, subject: str = DEFAULT_SUBJECT, max_results: int = 3) -> List[Paper]:
     """
     Search arXiv for papers matching keywords.
     
     Args:
         keywords: Search keywords (e.g., "dwarf galaxies", "Milky Way satellites")
+        subject: arXiv category to restrict the search to
         max_results: Number of papers to fetch
         
     Returns:
-        List of paper dictionaries with title, summary, and link
+        List of Paper tuples with title, summary, and link
     """
-    # Clean and format keywords for search
-#    search_query = keywords.replace(" ", "+")
+    # Build the query with urlencode so keywords are escaped properly and the
+    # URL (also the feed cache key) is stable from run to run
+    keyword_query = " AND ".join(f"all:{kw}" for kw in keywords.split())
+    params = {
+        "search_query": f"cat:{subject} AND {keyword_query}",
+        "sortBy": "submittedDate",
+        "sortOrder": "descending",
+        "start": 0,
+        "max_results": max_results
+    }
+    url = f"{ARXIV_API_URL}?{urlencode(params)}"
     
-    keyword_query = "+AND+".join([f"all:{kw}" for kw in keywords.strip().split()])
-    search_query = f"cat:{subject}+AND+{keyword_query}"
-
-
-    url = (
-        "http://export.arxiv.org/api/query?"
-        f"search_query={search_query}&"
-        "sortBy=submittedDate&sortOrder=descending&"
-        f"start=0&max_results={max_results}"
-    )
+    # Ask for a 304 when the feed is unchanged since the last run
+    cached = load_cached_feed(url)
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
     
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
-        root = ET.fromstring(response.content)
-        ns = {"atom": "http://www.w3.org/2005/Atom"}
-        entries = []
-        
-        for entry in root.findall("atom:entry", ns):
-            title_elem = entry.find("atom:title", ns)
-            summary_elem = entry.find("atom:summary", ns)
-            link_elem = entry.find("atom:id", ns)
-            
-            if title_elem is not None and summary_elem is not None and link_elem is not None:
-                raw_title = title_elem.text
-                raw_summary = summary_elem.text
-                link = link_elem.text.strip()
-                
-                # Clean up whitespace
-                title = clean_text(raw_title)
-                summary = clean_text(raw_summary)
+        with _SESSION.get(url, headers=headers, timeout=30, stream=True) as response:
+            if response.status_code == 304 and cached:
+                entries = [Paper(*entry) for entry in cached["entries"]]
+            else:
+                response.raise_for_status()
+                # Parse while the body is still arriving instead of buffering it
+                response.raw.decode_content = True
+                entries = parse_arxiv_entries(response.raw)
                 
-                entries.append({
-                    "title": title, 
-                    "summary": summary, 
-                    "link": link
-                })
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                if etag or last_modified:
+                    store_cached_feed(url, {
+                        "etag": etag,
+                        "last_modified": last_modified,
+                        # Plain tuples, so the cache does not depend on where Paper is defined
+                        "entries": [tuple(entry) for entry in entries]
+                    })
         
-        print(f"Found {len(entries)} papers for keywords: '{keywords}'")
+        print(f"Found {len(entries)} papers for keywords: '{keywords}' in {subject}")
         return entries
         
     except Exception as e:
         print(f"Error searching arXiv: {e}")
         return []
 
-def create_efficient_prompt(paper: Dict[str, str]) -> str:
-    """Create an efficient prompt for minimal token usage."""
-    # Truncate abstract to save tokens
-    abstract = paper['summary'][:150] if len(paper['summary']) > 150 else paper['summary']
+def search_subjects(keywords: str, subjects: List[str], max_results: int = 3) -> Dict[str, List[Paper]]:
+    """
+    Search several arXiv subjects concurrently.
     
-    prompt = f"""Summarize this arXiv paper in 2-3 bullet points:
-Title: {paper['title']}
-Abstract: {abstract}
+    Args:
+        keywords: Search keywords
+        subjects: arXiv categories to query
+        max_results: Number of papers to fetch per subject
+        
+    Returns:
+        Mapping of subject to its list of papers, in the order given
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(MAX_FETCH_WORKERS, len(subjects))) as executor:
+        futures = {
+            executor.submit(search_arxiv_papers, keywords, subject, max_results): subject
+            for subject in subjects
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    
+    return {subject: results[subject] for subject in subjects}
 
-Focus on key findings. Be concise."""
+def _get_model():
+    """Return the shared Gemini model, creating it on first use."""
+    global _MODEL
+    if _MODEL is None:
+        import google.generativeai as genai
+        genai.configure(api_key=GEMINI_API_KEY)
+        _MODEL = genai.GenerativeModel(GEMINI_MODEL)
+    return _MODEL
+
+def create_efficient_prompt(paper: Paper) -> str:
+    """Create an efficient prompt for minimal token usage."""
+    # Truncate abstract at a word boundary to save tokens
+    abstract = shorten(paper.summary, width=MAX_ABSTRACT_LENGTH, placeholder='…')
     
-    return prompt
+    return _PROMPT_TMPL.format(title=paper.title, abstract=abstract)
 
-def summarize_paper(paper: Dict[str, str]) -> str:
+def error_summary(paper: Paper) -> str:
+    """Placeholder section for a paper that could not be summarized."""
+    return f"## [{paper.title}]({paper.link})\n{ERROR_SUMMARY}"
+
+async def summarize_paper(paper: Paper) -> str:
     """Summarize a single paper using Gemini."""
     try:
         prompt = create_efficient_prompt(paper)
         
-        # Use the newer API format
-        model = genai.GenerativeModel("models/gemini-1.5-flash")
-        response = model.generate_content(prompt)
+        response = await _get_model().generate_content_async(prompt)
         
         summary = response.text.strip()
-        return f"## [{paper['title']}]({paper['link']})\n{summary}"
+        return f"## [{paper.title}]({paper.link})\n{summary}"
         
     except Exception as e:
         print(f"Error summarizing paper: {e}")
-        return f"## [{paper['title']}]({paper['link']})\nError processing paper."
+        return error_summary(paper)
 
-def format_for_slack(markdown_content: str, keywords: str) -> str:
-    """Convert markdown to Slack-compatible format."""
-    # Convert markdown headers to bold text
-    content = re.sub(r'^# (.+)$', r'*:newspaper: \1*', markdown_content, flags=re.MULTILINE)
-    content = re.sub(r'^## (.+)$', r'*:page_facing_up: \1*', content, flags=re.MULTILINE)
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the token count of text (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+def create_batch_prompt(papers: List[Paper]) -> str:
+    """Create one prompt that asks for a delimited summary of every paper."""
+    sections = []
+    for k, paper in enumerate(papers, 1):
+        abstract = shorten(paper.summary, width=MAX_ABSTRACT_LENGTH, placeholder='…')
+        sections.append(_BATCH_SECTION_TMPL.format(index=k, title=paper.title, abstract=abstract))
+    
+    return _BATCH_PROMPT_TMPL.format(papers="\n\n".join(sections))
+
+def batch_papers(papers: List[Paper]) -> List[List[Paper]]:
+    """Group papers into batches that fit within MAX_TOKENS_PER_BATCH."""
+    batches = []
+    batch = []
+    batch_tokens = 0
+    
+    for paper in papers:
+        tokens = estimate_tokens(create_efficient_prompt(paper))
+        if batch and batch_tokens + tokens > MAX_TOKENS_PER_BATCH:
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(paper)
+        batch_tokens += tokens
+    
+    if batch:
+        batches.append(batch)
+    return batches
+
+async def summarize_batch(papers: List[Paper]) -> List[str]:
+    """Summarize a batch of papers with a single Gemini call."""
+    if len(papers) == 1:
+        return [await summarize_paper(papers[0])]
+    
+    try:
+        prompt = create_batch_prompt(papers)
+        
+        response = await _get_model().generate_content_async(prompt)
+        
+        # Split into ['', '1', body, '2', body, ...]
+        parts = _BATCH_MARKER_RE.split(response.text)
+        bodies = {int(k): body.strip() for k, body in zip(parts[1::2], parts[2::2])}
+        if sorted(bodies) != list(range(1, len(papers) + 1)):
+            raise ValueError(f"expected {len(papers)} delimited summaries, got {len(bodies)}")
+        
+        return [
+            f"## [{paper.title}]({paper.link})\n{bodies[k]}"
+            for k, paper in enumerate(papers, 1)
+        ]
+        
+    except Exception as e:
+        print(f"Error summarizing batch, retrying papers individually: {e}")
+        # Retry one at a time so the batch keeps using a single parallelism slot
+        return [await summarize_paper(paper) for paper in papers]
+
+async def summarize_batches(batches: List[List[Paper]]) -> List[str]:
+    """Summarize all batches concurrently, at most GEMINI_PARALLELISM at a time."""
+    semaphore = asyncio.Semaphore(GEMINI_PARALLELISM)
     
-    # Convert markdown links to Slack format
-    content = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<\2|\1>', content)
+    async def run(batch: List[Paper]) -> List[str]:
+        async with semaphore:
+            return await summarize_batch(batch)
     
-    # Convert bullet points
-    content = re.sub(r'^\s*[-*]\s+', '• ', content, flags=re.MULTILINE)
+    results = await asyncio.gather(*(run(batch) for batch in batches), return_exceptions=True)
+    
+    summaries = []
+    for batch, result in zip(batches, results):
+        if isinstance(result, BaseException):
+            print(f"Error summarizing batch: {result}")
+            result = [error_summary(paper) for paper in batch]
+        summaries.extend(result)
+    return summaries
+
+def summary_cache_key(paper: Paper) -> str:
+    """Build the summary cache key from the arXiv link and the prompt, so prompt changes miss."""
+    return hash_text(paper.link + create_efficient_prompt(paper))
+
+def summarize_papers(papers: List[Paper]) -> List[str]:
+    """Summarize papers in batches, running batches concurrently and preserving order."""
+    cache = open_cache("summaries")
+    try:
+        keys = [summary_cache_key(paper) for paper in papers]
+        summaries = {key: cache[key] for key in keys if key in cache}
+        if summaries:
+            print(f"Reusing {len(summaries)} cached summaries")
+        
+        pending = [(key, paper) for key, paper in zip(keys, papers) if key not in summaries]
+        batches = batch_papers([paper for _, paper in pending])
+        for i, batch in enumerate(batches, 1):
+            print(f"Processing batch {i}/{len(batches)}: {len(batch)} papers...")
+        
+        results = asyncio.run(summarize_batches(batches)) if batches else []
+        
+        for (key, _), summary in zip(pending, results):
+            summaries[key] = summary
+            if not summary.endswith(ERROR_SUMMARY):
+                try:
+                    cache[key] = summary
+                except Exception as e:
+                    print(f"⚠️ Could not cache summary: {e}")
+        
+        return [summaries[key] for key in keys]
+    finally:
+        close_cache(cache)
+
+def _slack_markup(match: re.Match) -> str:
+    """Replacement for one _SLACK_MARKUP_RE match."""
+    if match.group('h1') is not None:
+        return "*:newspaper: " + _LINK_RE.sub(r'<\2|\1>', match.group('h1')) + "*"
+    if match.group('h2') is not None:
+        # Header lines are consumed whole, so convert links inside them here
+        return "*:page_facing_up: " + _LINK_RE.sub(r'<\2|\1>', match.group('h2')) + "*"
+    if match.group('url') is not None:
+        return f"<{match.group('url')}|{match.group('text')}>"
+    return '• '
+
+def _format_slack_part(part: str) -> str:
+    """Convert one markdown part to Slack-compatible format."""
+    # Convert headers to bold text, links to Slack format and bullet points
+    content = _SLACK_MARKUP_RE.sub(_slack_markup, part)
     
     # Remove excessive newlines
-    content = re.sub(r'\n{3,}', '\n\n', content)
+    return _MULTI_NEWLINE_RE.sub('\n\n', content).strip()
+
+def format_for_slack_lines(parts: List[str], keywords: str, run_time: Optional[datetime] = None) -> str:
+    """
+    Convert markdown parts (headings and paper sections) to one Slack message.
+    
+    Each part is formatted on its own and the results are joined once, so the
+    full digest is never rewritten as a whole.
+    """
+    content = "\n\n".join(filter(None, map(_format_slack_part, parts)))
     
     # Add header
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    timestamp = (run_time or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
     header = f":mag: *ArXiv Search Results for '{keywords}'* - {timestamp}\n\n"
     
-    return header + content.strip()
+    return header + content
+
+def format_for_slack(markdown_content: str, keywords: str, run_time: Optional[datetime] = None) -> str:
+    """Convert markdown to Slack-compatible format."""
+    return format_for_slack_lines([markdown_content], keywords, run_time)
 
 def send_to_slack(message: str) -> bool:
     """Send message to Slack."""
+    from slack_sdk import WebClient
+    from slack_sdk.errors import SlackApiError
+    
     try:
         client = WebClient(token=SLACK_BOT_TOKEN)
         response = client.chat_postMessage(
@@ -168,11 +454,14 @@ def send_to_slack(message: str) -> bool:
 def main():
     """Main function."""
     if len(sys.argv) < 2:
-        print("Usage: python simple_arxiv_search.py 'your keywords'")
-        print("Example: python simple_arxiv_search.py 'dwarf galaxies'")
+        print("Usage: python simple_arxiv_search.py 'your keywords' [subject ...]")
+        print("Example: python simple_arxiv_search.py 'dwarf galaxies' astro-ph.GA astro-ph.CO")
         sys.exit(1)
     
     keywords = sys.argv[1]
+    subjects = sys.argv[2:] or [DEFAULT_SUBJECT]
+    # One timestamp per run, shared by the Slack header and the backup file
+    run_time = datetime.now()
     
     # Check API keys
     if not GEMINI_API_KEY:
@@ -183,31 +472,37 @@ def main():
         print("❌ SLACK_BOT_TOKEN or SLACK_CHANNEL_ID not set in .env file")
         sys.exit(1)
     
-    print(f"🔍 Searching arXiv for: '{keywords}'")
+    print(f"🔍 Searching arXiv for: '{keywords}' in {', '.join(subjects)}")
     print("=" * 50)
     
     # Search for papers
-    papers = search_arxiv_papers(keywords, max_results=3)
+    papers_by_subject = search_subjects(keywords, subjects, max_results=3)
     
-    if not papers:
+    if not any(papers_by_subject.values()):
         print("❌ No papers found for the given keywords")
         sys.exit(1)
     
-    # Summarize each paper
-    print(f"📝 Summarizing {len(papers)} papers...")
-    summaries = []
-    
-    for i, paper in enumerate(papers, 1):
-        print(f"Processing paper {i}/{len(papers)}: {paper['title'][:50]}...")
-        summary = summarize_paper(paper)
-        summaries.append(summary)
+    # Summarize all subjects together so batches span subjects, and papers
+    # cross-listed in several subjects are only summarized once
+    unique_papers = list({
+        paper.link: paper for papers in papers_by_subject.values() for paper in papers
+    }.values())
+    print(f"📝 Summarizing {len(unique_papers)} papers...")
+    summaries = dict(zip(
+        (paper.link for paper in unique_papers),
+        summarize_papers(unique_papers)
+    ))
     
-    # Combine summaries
-    markdown_content = f"# ArXiv Papers for '{keywords}'\n\n"
-    markdown_content += "\n\n".join(summaries)
+    # Collect the digest as a list of parts; it is only joined into one
+    # markdown document if the Slack post fails and a backup is written
+    parts = []
+    for subject, papers in papers_by_subject.items():
+        if papers:
+            parts.append(f"# ArXiv Papers for '{keywords}' in {subject}")
+            parts.extend(summaries[paper.link] for paper in papers)
     
     # Format for Slack and send
-    slack_message = format_for_slack(markdown_content, keywords)
+    slack_message = format_for_slack_lines(parts, keywords, run_time)
     
     print("\n📤 Sending to Slack...")
     success = send_to_slack(slack_message)
@@ -217,10 +512,12 @@ def main():
     else:
         print("❌ Failed to send to Slack")
         # Save to file as backup
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        markdown_content = "\n\n".join(parts)
+        timestamp = run_time.strftime("%Y-%m-%d_%H-%M-%S")
         filename = f"arxiv_search_{keywords.replace(' ', '_')}_{timestamp}.md"
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(markdown_content)
+        # Encode once and write bytes, bypassing the text I/O layer
+        with open(filename, "wb") as f:
+            f.write(markdown_content.encode("utf-8"))
         print(f"📄 Saved to file: {filename}")
 
 if __name__ == "__main__":